@@ -1,10 +1,12 @@
 """
 Configuration management for PostgreSQL MCP Server
-All values are read from .env file - no hardcoded defaults.
+All values are read from .env file. Database, server and pool settings are
+required; optional feature settings fall back to the defaults below.
 """
 
 import os
 import sys
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -39,6 +41,25 @@ class Config:
     POOL_MIN_SIZE = int(_require_env('POOL_MIN_SIZE'))
     POOL_MAX_SIZE = int(_require_env('POOL_MAX_SIZE'))
 
+    # Progress notification settings (stdio server, optional)
+    PROGRESS_CHUNK_SIZE = int(os.getenv('PROGRESS_CHUNK_SIZE', '500'))
+    PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', '2.0'))
+    PROGRESS_RESULT_MAX_ROWS = int(os.getenv('PROGRESS_RESULT_MAX_ROWS', '0'))
+
+    # Background query job settings (optional)
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+    JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '20'))
+    JOB_CHUNK_SIZE = int(os.getenv('JOB_CHUNK_SIZE', '1000'))
+    JOB_FETCH_LIMIT = int(os.getenv('JOB_FETCH_LIMIT', '1000'))
+    JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', '3600'))
+    JOB_STATEMENT_TIMEOUT = int(os.getenv('JOB_STATEMENT_TIMEOUT', '0'))
+    JOB_HEARTBEAT_INTERVAL = int(os.getenv('JOB_HEARTBEAT_INTERVAL', '10'))
+    JOB_STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', '60'))
+    JOB_RESULT_DIR = os.getenv('JOB_RESULT_DIR', os.path.join(
+        tempfile.gettempdir(),
+        f"mcp-postgres-jobs-{os.getuid()}" if hasattr(os, 'getuid') else 'mcp-postgres-jobs'
+    ))
+
     @classmethod
     def get_database_url(cls) -> str:
         """Get PostgreSQL connection URL"""
@@ -0,0 +1,592 @@
+"""
+Async query job queue for long-running read-only queries
+Jobs run on a dedicated, bounded connection pool and their results spill to disk
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import socket
+import stat
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+from config import Config
+from pg_types import postgres_json_default
+
+logger = logging.getLogger("MCPServer-Jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+# How often cancel markers from other processes are checked, in seconds
+JOB_POLL_INTERVAL = 1.0
+
+
+class JobError(Exception):
+    """Raised for unknown jobs, a full queue or invalid job operations"""
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, default=postgres_json_default, separators=(",", ":"))
+
+
+# MCP tool definitions shared by the HTTP and stdio servers
+JOB_TOOLS = [
+    {
+        "name": "submit_query",
+        "description": "Submit a long-running SELECT query as a background job. Returns a job_id to poll with job_status.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "The SQL SELECT query to execute"
+                }
+            },
+            "required": ["query"]
+        }
+    },
+    {
+        "name": "job_status",
+        "description": "Get the status of a background query job.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "job_id": {
+                    "type": "string",
+                    "description": "Job ID returned by submit_query"
+                }
+            },
+            "required": ["job_id"]
+        }
+    },
+    {
+        "name": "fetch_job_result",
+        "description": "Fetch a page of rows from a completed background query job.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "job_id": {
+                    "type": "string",
+                    "description": "Job ID returned by submit_query"
+                },
+                "offset": {
+                    "type": "integer",
+                    "description": "Index of the first row to return (default: 0)"
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "Maximum number of rows to return (default: JOB_FETCH_LIMIT)"
+                }
+            },
+            "required": ["job_id"]
+        }
+    },
+    {
+        "name": "cancel_job",
+        "description": "Cancel a queued or running background query job.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "job_id": {
+                    "type": "string",
+                    "description": "Job ID returned by submit_query"
+                }
+            },
+            "required": ["job_id"]
+        }
+    }
+]
+
+
+class JobScheduler:
+    """In-process job scheduler backed by its own connection pool.
+
+    Job state and results live in JOB_RESULT_DIR, so any server process
+    pointed at the same directory can report status, fetch results and
+    request cancellation of a job submitted elsewhere. Each process
+    refreshes `updated_at` on the jobs it owns; jobs whose owner stops
+    doing so are failed by whichever process notices first.
+    """
+
+    def __init__(self):
+        self.result_dir = Config.JOB_RESULT_DIR
+        self.pool: Optional[asyncpg.Pool] = None
+        self.owner = {"host": socket.gethostname(), "pid": os.getpid(), "instance": uuid.uuid4().hex}
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._state_lock: Optional[asyncio.Lock] = None
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    # Lifecycle
+
+    async def start(self):
+        """Create the job pool and start the workers, monitor and TTL cleanup"""
+        await asyncio.get_running_loop().run_in_executor(None, _prepare_private_dir, self.result_dir)
+        server_settings = {}
+        if Config.JOB_STATEMENT_TIMEOUT > 0:
+            server_settings["statement_timeout"] = str(Config.JOB_STATEMENT_TIMEOUT * 1000)
+        pool = await asyncpg.create_pool(
+            host=Config.DB_HOST,
+            port=Config.DB_PORT,
+            database=Config.DB_NAME,
+            user=Config.DB_USER,
+            password=Config.DB_PASSWORD,
+            min_size=0,
+            max_size=Config.JOB_WORKERS,
+            server_settings=server_settings
+        )
+        self._executor = ThreadPoolExecutor(max_workers=Config.JOB_WORKERS + 1, thread_name_prefix="jobs")
+        self._state_lock = asyncio.Lock()
+        self._queue = asyncio.Queue()
+        try:
+            # Fail jobs left behind by processes that are gone before taking new work
+            await self._cleanup()
+        except Exception:
+            await pool.close()
+            self._executor.shutdown(wait=False)
+            raise
+        self.pool = pool
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(Config.JOB_WORKERS)]
+        self._tasks.append(asyncio.create_task(self._monitor_loop()))
+        self._tasks.append(asyncio.create_task(self._cleanup_loop()))
+        logger.info(f"Job scheduler started with {Config.JOB_WORKERS} workers, results in {self.result_dir}")
+
+    async def stop(self):
+        """Cancel outstanding jobs, stop the workers and close the job pool"""
+        running = list(self._running.values())
+        for task in self._tasks + running:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *running, return_exceptions=True)
+        for job in self._jobs.values():
+            if job["status"] == QUEUED:
+                await self._finish(job, CANCELLED, error="Server shut down before the job started")
+        await self.pool.close()
+        self.pool = None
+        self._executor.shutdown(wait=True)
+        logger.info("Job scheduler stopped")
+
+    # Public operations
+
+    async def submit(self, query: str) -> Dict[str, Any]:
+        """Queue a query and return its initial job state"""
+        self._require_started()
+        if not query:
+            raise JobError("query is required")
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "query": query,
+            "submitted_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "updated_at": now,
+            "row_count": 0,
+            "error": None,
+            "owner": self.owner
+        }
+        # Count waiting jobs rather than queue entries; cancelled ids stay queued until popped
+        waiting = sum(1 for queued in self._jobs.values() if queued["status"] == QUEUED)
+        if waiting >= Config.JOB_QUEUE_SIZE:
+            raise JobError(f"Job queue is full ({Config.JOB_QUEUE_SIZE} jobs pending), try again later")
+        self._queue.put_nowait(job["job_id"])
+        self._jobs[job["job_id"]] = job
+        await self._persist(job)
+        return self._public(job)
+
+    async def status(self, job_id: str) -> Dict[str, Any]:
+        """Return the current state of a job"""
+        self._require_started()
+        return self._public(await self._load(job_id))
+
+    async def fetch_result(self, job_id: str, offset: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Return a page of rows from a completed job's result file"""
+        self._require_started()
+        job = await self._load(job_id)
+        if job["status"] != COMPLETED:
+            raise JobError(f"Job {job_id} is {job['status']}, results are only available once it has completed")
+        offset = max(int(offset or 0), 0)
+        limit = int(limit or Config.JOB_FETCH_LIMIT)
+        limit = max(min(limit, Config.JOB_FETCH_LIMIT), 1)
+
+        try:
+            columns, rows = await self._run(self._read_rows, job_id, offset, limit)
+        except FileNotFoundError:
+            raise JobError(f"Job {job_id} results have expired")
+        return {
+            "job_id": job_id,
+            "columns": columns,
+            "rows": rows,
+            "offset": offset,
+            "row_count": job["row_count"],
+            "has_more": offset + len(rows) < job["row_count"]
+        }
+
+    async def cancel(self, job_id: str) -> Dict[str, Any]:
+        """Cancel a queued or running job"""
+        self._require_started()
+        job = await self._load(job_id)
+        if job["status"] in FINISHED_STATES:
+            return self._public(job)
+
+        local = self._jobs.get(job_id)
+        if local is None:
+            # Owned by another live server process; its monitor picks up the marker
+            await self._run(self._touch, self._path(job_id, ".cancel"))
+            return {**self._public(job), "cancel_requested": True}
+
+        task = self._running.get(job_id)
+        if task is not None:
+            # The job records itself as cancelled once the task unwinds
+            self._cancel_task(job_id, task)
+            return {**self._public(local), "cancel_requested": True}
+        await self._finish(local, CANCELLED)
+        return self._public(local)
+
+    # Workers
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self._jobs.get(job_id)
+                if job is None or job["status"] != QUEUED:
+                    continue
+                task = asyncio.create_task(self._execute(job))
+                self._running[job_id] = task
+                # wait() does not propagate the job task's cancellation to this worker
+                await asyncio.wait({task})
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error(f"Job {job_id} task error: {task.exception()}")
+                if job["status"] not in FINISHED_STATES:
+                    # The task ended before it could record an outcome
+                    try:
+                        await self._finish(job, CANCELLED if task.cancelled() else FAILED,
+                                           error=None if task.cancelled() else "Job ended unexpectedly")
+                    except Exception as e:
+                        logger.error(f"Job {job_id} state could not be saved: {e}")
+            finally:
+                self._running.pop(job_id, None)
+                self._queue.task_done()
+
+    async def _execute(self, job: Dict[str, Any]):
+        job_id = job["job_id"]
+        job["status"] = RUNNING
+        job["started_at"] = time.time()
+        partial_path = self._path(job_id, ".jsonl.gz.part")
+        index = {"columns": [], "chunk_size": Config.JOB_CHUNK_SIZE, "offsets": []}
+        out = None
+        try:
+            await self._persist(job)
+            out = await self._run(_open_private, partial_path, "wb")
+            async with self.pool.acquire() as conn:
+                async with conn.transaction(readonly=True):
+                    # Cancelling this task while a fetch is pending makes asyncpg send a
+                    # protocol-level cancel request, so the server stops the statement too
+                    cursor = await conn.cursor(job["query"])
+                    while True:
+                        rows = await cursor.fetch(Config.JOB_CHUNK_SIZE)
+                        if not rows:
+                            break
+                        if not index["offsets"]:
+                            index["columns"] = list(rows[0].keys())
+                        index["offsets"].append(await self._run(self._write_chunk, out, rows))
+                        job["row_count"] += len(rows)
+            await self._run(self._complete_result, out, partial_path, job_id, index)
+            await self._finish(job, COMPLETED)
+            logger.info(f"Job {job_id} completed with {job['row_count']} rows")
+        except asyncio.CancelledError:
+            await self._run(self._discard, out, partial_path)
+            await self._finish(job, CANCELLED)
+            logger.info(f"Job {job_id} cancelled")
+        except Exception as e:
+            await self._run(self._discard, out, partial_path)
+            await self._finish(job, FAILED, error=str(e))
+            logger.error(f"Job {job_id} failed: {e}")
+
+    async def _monitor_loop(self):
+        """Apply cancel markers from other processes and refresh owned job heartbeats"""
+        last_heartbeat = time.monotonic()
+        while True:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            try:
+                pending = [job_id for job_id, job in self._jobs.items() if job["status"] in (QUEUED, RUNNING)]
+                if not pending:
+                    continue
+                for job_id in await self._run(self._cancel_markers, pending):
+                    task = self._running.get(job_id)
+                    if task is not None:
+                        self._cancel_task(job_id, task)
+                    elif self._jobs[job_id]["status"] == QUEUED:
+                        await self._finish(self._jobs[job_id], CANCELLED)
+                if time.monotonic() - last_heartbeat >= Config.JOB_HEARTBEAT_INTERVAL:
+                    last_heartbeat = time.monotonic()
+                    for job_id in pending:
+                        job = self._jobs[job_id]
+                        if job["status"] in (QUEUED, RUNNING):
+                            await self._persist(job)
+            except Exception as e:
+                logger.error(f"Job monitor error: {e}")
+
+    async def _cleanup_loop(self):
+        interval = max(1, min(Config.JOB_RESULT_TTL, 60))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._cleanup()
+            except Exception as e:
+                logger.error(f"Job cleanup error: {e}")
+
+    async def _cleanup(self):
+        """Expire finished jobs, fail orphaned ones and drop their leftover files"""
+        active = frozenset(job_id for job_id, job in self._jobs.items() if job["status"] not in FINISHED_STATES)
+        expired = await self._run(self._cleanup_files, active)
+        for job_id in expired:
+            self._jobs.pop(job_id, None)
+            logger.info(f"Job {job_id} expired and was removed")
+
+    # Helpers
+
+    def _require_started(self):
+        if self.pool is None:
+            raise JobError("Background query jobs are not available on this server")
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _cancel_task(self, job_id: str, task: asyncio.Task):
+        self._jobs[job_id]["cancel_requested"] = True
+        task.cancel()
+
+    def _path(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.result_dir, job_id + suffix)
+
+    async def _load(self, job_id: str) -> Dict[str, Any]:
+        if not job_id:
+            raise JobError("job_id is required")
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        # Reject anything that is not one of our ids before touching the filesystem
+        try:
+            uuid.UUID(hex=job_id)
+        except ValueError:
+            raise JobError(f"Unknown job: {job_id}")
+        try:
+            job = await self._run(self._read_state, job_id)
+        except FileNotFoundError:
+            raise JobError(f"Unknown job: {job_id}")
+        if self._is_orphaned(job, time.time()):
+            await self._run(self._fail_orphan, job)
+        return job
+
+    async def _persist(self, job: Dict[str, Any]):
+        """Write the job state file off the event loop, in submission order"""
+        async with self._state_lock:
+            job["updated_at"] = time.time()
+            await self._run(self._write_state, job["job_id"], self._state(job))
+
+    async def _finish(self, job: Dict[str, Any], status: str, error: Optional[str] = None):
+        job["status"] = status
+        job["error"] = error
+        job["finished_at"] = time.time()
+        if status != COMPLETED:
+            job["row_count"] = 0
+        await self._persist(job)
+
+    def _is_orphaned(self, job: Dict[str, Any], now: float) -> bool:
+        """Whether an unfinished job belongs to a process that no longer runs it"""
+        if job["status"] in FINISHED_STATES:
+            return False
+        owner = job.get("owner") or {}
+        if owner.get("instance") == self.owner["instance"]:
+            return False
+        if (job.get("updated_at") or 0) < now - Config.JOB_STALE_AFTER:
+            return True
+        if owner.get("host") == self.owner["host"]:
+            # Same pid with another instance id means the owner restarted
+            return owner.get("pid") == self.owner["pid"] or not _pid_alive(owner.get("pid"))
+        return False
+
+    # Blocking file operations, run in the job executor
+
+    def _read_state(self, job_id: str) -> Dict[str, Any]:
+        with open(self._path(job_id, ".json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_state(self, job_id: str, state: Dict[str, Any]):
+        _write_json(self._path(job_id, ".json"), state)
+
+    def _fail_orphan(self, job: Dict[str, Any]):
+        job["status"] = FAILED
+        job["error"] = "The server process running this job stopped"
+        job["finished_at"] = job["updated_at"] = time.time()
+        job["row_count"] = 0
+        self._write_state(job["job_id"], self._state(job))
+        for suffix in (".jsonl.gz.part", ".cancel"):
+            _remove(self._path(job["job_id"], suffix))
+        logger.warning(f"Job {job['job_id']} was orphaned and has been marked failed")
+
+    def _cleanup_files(self, active_ids) -> List[str]:
+        now = time.time()
+        expires_before = now - Config.JOB_RESULT_TTL
+        expired = []
+        names = os.listdir(self.result_dir)
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            job_id = name[:-len(".json")]
+            if job_id in active_ids:
+                continue
+            try:
+                job = self._read_state(job_id)
+            except (OSError, ValueError):
+                continue
+            if self._is_orphaned(job, now):
+                self._fail_orphan(job)
+                continue
+            if job["status"] not in FINISHED_STATES or job["finished_at"] > expires_before:
+                continue
+            for suffix in (".jsonl.gz", ".idx", ".cancel", ".json"):
+                _remove(self._path(job_id, suffix))
+            expired.append(job_id)
+
+        # Partial results and state temp files whose writer has gone away
+        stale_before = now - Config.JOB_STALE_AFTER
+        for name in names:
+            if not (name.endswith(".part") or name.endswith(".tmp")):
+                continue
+            job_id = name.split(".", 1)[0]
+            if job_id in active_ids:
+                continue
+            path = os.path.join(self.result_dir, name)
+            try:
+                if os.path.getmtime(path) < stale_before:
+                    _remove(path)
+            except OSError:
+                pass
+        return expired
+
+    def _cancel_markers(self, job_ids: List[str]) -> List[str]:
+        return [job_id for job_id in job_ids if os.path.exists(self._path(job_id, ".cancel"))]
+
+    @staticmethod
+    def _touch(path: str):
+        _open_private(path, "w").close()
+
+    @staticmethod
+    def _write_chunk(out, rows) -> int:
+        """Append one chunk as its own gzip member and return its byte offset"""
+        offset = out.tell()
+        data = "".join(_dumps(list(row.values())) + "\n" for row in rows)
+        out.write(gzip.compress(data.encode("utf-8")))
+        return offset
+
+    def _complete_result(self, out, partial_path: str, job_id: str, index: Dict[str, Any]):
+        index["length"] = out.tell()
+        out.close()
+        _write_json(self._path(job_id, ".idx"), index)
+        os.replace(partial_path, self._path(job_id, ".jsonl.gz"))
+
+    def _read_rows(self, job_id: str, offset: int, limit: int):
+        """Read a page by seeking straight to the chunks that cover it"""
+        with open(self._path(job_id, ".idx"), encoding="utf-8") as f:
+            index = json.load(f)
+        columns = index["columns"]
+        offsets = index["offsets"] + [index["length"]]
+        chunk_size = index["chunk_size"]
+        rows = []
+        chunk = offset // chunk_size
+        skip = offset % chunk_size
+        with open(self._path(job_id, ".jsonl.gz"), "rb") as f:
+            while chunk < len(offsets) - 1 and len(rows) < limit:
+                f.seek(offsets[chunk])
+                data = gzip.decompress(f.read(offsets[chunk + 1] - offsets[chunk]))
+                lines = data.decode("utf-8").splitlines()[skip:skip + limit - len(rows)]
+                rows.extend(dict(zip(columns, json.loads(line))) for line in lines)
+                chunk += 1
+                skip = 0
+        return columns, rows
+
+    @staticmethod
+    def _discard(out, partial_path: str):
+        if out is not None:
+            out.close()
+        _remove(partial_path)
+
+    @staticmethod
+    def _state(job: Dict[str, Any]) -> Dict[str, Any]:
+        """Job state as stored on disk, including scheduler-only fields"""
+        state = {k: v for k, v in job.items() if k not in ("cancel_requested", "expires_at")}
+        if state["finished_at"] is not None:
+            state["expires_at"] = state["finished_at"] + Config.JOB_RESULT_TTL
+        return state
+
+    @classmethod
+    def _public(cls, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Job state as returned to clients"""
+        return {k: v for k, v in cls._state(job).items() if k not in ("owner", "updated_at")}
+
+
+def _write_json(path: str, data: Dict[str, Any]):
+    """Atomically replace a small JSON file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with _open_private(tmp_path, "w", encoding="utf-8") as f:
+        f.write(_dumps(data))
+    os.replace(tmp_path, path)
+
+
+def _open_private(path: str, mode: str, **kwargs):
+    """Open a file for writing that only the current user can read"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    return os.fdopen(fd, mode, **kwargs)
+
+
+def _prepare_private_dir(path: str):
+    """Create the result directory for this user only, refusing one others can reach"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if os.name == "nt":
+        # The default location is already inside the user's own profile
+        return
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise JobError(f"JOB_RESULT_DIR {path} is not a directory")
+    if st.st_uid != os.getuid():
+        raise JobError(f"JOB_RESULT_DIR {path} is owned by another user")
+    if st.st_mode & 0o077:
+        raise JobError(f"JOB_RESULT_DIR {path} is accessible to other users; chmod 700 it")
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    """Best-effort liveness check for a process on this host"""
+    if not pid or os.name == "nt":
+        # os.kill(pid, 0) would terminate the process on Windows; rely on heartbeats
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,34 @@
+"""
+JSON conversion for PostgreSQL values
+Shared by the stdio server and the background job queue
+"""
+
+import json
+from decimal import Decimal
+from datetime import date, datetime
+
+
+def postgres_json_default(obj):
+    """Convert a PostgreSQL value json cannot encode natively, or raise TypeError"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    raise TypeError(f"Cannot encode PostgreSQL value of type {type(obj).__name__} as JSON")
+
+
+# Custom JSON encoder for PostgreSQL types
+class PostgresJSONEncoder(json.JSONEncoder):
+    def default(self, obj):
+        return postgres_json_default(obj)
+
+
+def convert_postgres_types(obj):
+    """Convert PostgreSQL types to JSON-serializable types"""
+    if isinstance(obj, (Decimal, date, datetime)):
+        return postgres_json_default(obj)
+    if isinstance(obj, dict):
+        return {k: convert_postgres_types(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [convert_postgres_types(item) for item in obj]
+    return obj
@@ -10,6 +10,7 @@ import asyncpg
 import uvicorn
 from contextlib import asynccontextmanager
 from config import Config
+from jobs import JOB_TOOLS, JobScheduler
 import logging
 
 # Configuration
@@ -33,6 +34,7 @@ class ToolCallRequest(BaseModel):
 # Database connection pool
 db_pool: Optional[asyncpg.Pool] = None
 db_config = DatabaseConfig()
+job_scheduler = JobScheduler()
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -57,8 +59,19 @@ async def lifespan(app: FastAPI):
         print(f"❌ Failed to connect to database: {e}")
         db_pool = None
 
+    # Startup: Background jobs are optional; only the job tools depend on them
+    if db_pool:
+        try:
+            await job_scheduler.start()
+        except Exception as e:
+            print(f"⚠️  Background query jobs disabled: {e}")
+
     yield
 
+    # Shutdown: Stop background jobs before closing the interactive pool
+    if job_scheduler.pool:
+        await job_scheduler.stop()
+
     # Shutdown: Close database connection pool
     if db_pool:
         await db_pool.close()
@@ -136,6 +149,7 @@ async def list_tools():
             }
         )
     ]
+    tools.extend(Tool(**tool) for tool in JOB_TOOLS)
 
     return {"tools": [tool.dict() for tool in tools]}
 
@@ -165,6 +179,26 @@ async def call_tool(request: ToolCallRequest):
             result = await analyze_query_plan(request.arguments.get("query"))
             return {"result": result}
 
+        elif request.name == "submit_query":
+            result = await job_scheduler.submit(request.arguments.get("query"))
+            return {"result": result}
+
+        elif request.name == "job_status":
+            result = await job_scheduler.status(request.arguments.get("job_id"))
+            return {"result": result}
+
+        elif request.name == "fetch_job_result":
+            result = await job_scheduler.fetch_result(
+                request.arguments.get("job_id"),
+                request.arguments.get("offset", 0),
+                request.arguments.get("limit")
+            )
+            return {"result": result}
+
+        elif request.name == "cancel_job":
+            result = await job_scheduler.cancel(request.arguments.get("job_id"))
+            return {"result": result}
+
         else:
             raise HTTPException(status_code=404, detail=f"Tool '{request.name}' not found")
 
@@ -6,12 +6,13 @@ Compatible with GitHub Copilot in VS Code
 import asyncio
 import json
 import sys
+import time
 import asyncpg
 import logging
-from decimal import Decimal
-from datetime import date, datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from config import Config
+from jobs import JOB_TOOLS, JobScheduler
+from pg_types import PostgresJSONEncoder, convert_postgres_types
 
 # Configure logging to stderr (stdout is used for MCP protocol)
 logging.basicConfig(
@@ -31,16 +32,86 @@ class DatabaseConfig:
 
 db_config = DatabaseConfig()
 db_pool: Optional[asyncpg.Pool] = None
+job_scheduler = JobScheduler()
+
+
+# Serialized writer for stdout: responses and notifications share one stream,
+# so every message goes out as a single line under this lock.
+_write_lock: Optional[asyncio.Lock] = None
+
+
+async def write_message(message: Dict[str, Any]):
+    """Write a single JSON-RPC message to stdout"""
+    global _write_lock
+    if _write_lock is None:
+        _write_lock = asyncio.Lock()
+    line = json.dumps(message, cls=PostgresJSONEncoder)
+    async with _write_lock:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+
+class ProgressReporter:
+    """Emits notifications/progress for a request that supplied a progressToken.
+
+    MCP requires `progress` to increase with every notification, so it counts
+    notifications sent; rows fetched and elapsed time travel as extra fields.
+    """
+
+    def __init__(self, token: Any):
+        self.token = token
+        self.started = time.monotonic()
+        self.rows = 0
+        self.sent = 0
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    def elapsed(self) -> float:
+        return round(time.monotonic() - self.started, 3)
+
+    async def report(self, rows: Optional[List[Dict[str, Any]]] = None, message: Optional[str] = None):
+        """Send a progress notification, optionally carrying a chunk of partial rows"""
+        self.sent += 1
+        params: Dict[str, Any] = {
+            "progressToken": self.token,
+            "progress": self.sent,
+            "message": message or f"{self.rows} rows fetched in {self.elapsed()}s",
+            "rows_fetched": self.rows,
+            "elapsed_seconds": self.elapsed()
+        }
+        if rows is not None:
+            params["partialResult"] = {
+                "offset": self.rows - len(rows),
+                "rows": rows
+            }
+        await write_message({
+            "jsonrpc": "2.0",
+            "method": "notifications/progress",
+            "params": params
+        })
 
-
-# Custom JSON encoder for PostgreSQL types
-class PostgresJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        if isinstance(obj, (date, datetime)):
-            return obj.isoformat()
-        return super().default(obj)
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(Config.PROGRESS_INTERVAL)
+            await self.report()
+
+    async def __aenter__(self):
+        if Config.PROGRESS_INTERVAL > 0:
+            self._heartbeat = asyncio.create_task(self._beat())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # Stop the heartbeat before the response is written so no notification follows it
+        if self._heartbeat is None:
+            return False
+        self._heartbeat.cancel()
+        try:
+            await self._heartbeat
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # A failed heartbeat must not replace the tool's own result or error
+            logger.error(f"Progress heartbeat error: {e}")
+        return False
 
 
 async def init_db():
@@ -57,15 +128,23 @@ async def init_db():
             max_size=Config.POOL_MAX_SIZE
         )
         logger.info(f"✅ Connected to PostgreSQL database: {db_config.database}")
-        return True
     except Exception as e:
         logger.error(f"❌ Failed to connect to database: {e}")
         return False
 
+    # Background jobs are optional; only the job tools depend on them
+    try:
+        await job_scheduler.start()
+    except Exception as e:
+        logger.error(f"⚠️  Background query jobs disabled: {e}")
+    return True
+
 
 async def close_db():
     """Close database connection pool"""
     global db_pool
+    if job_scheduler.pool:
+        await job_scheduler.stop()
     if db_pool:
         await db_pool.close()
         logger.info("Database connection pool closed")
@@ -73,23 +152,36 @@ async def close_db():
 
 # Tool implementations
 
-def convert_postgres_types(obj):
-    """Convert PostgreSQL types to JSON-serializable types"""
-    if isinstance(obj, Decimal):
-        return float(obj)
-    if isinstance(obj, (date, datetime)):
-        return obj.isoformat()
-    if isinstance(obj, dict):
-        return {k: convert_postgres_types(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [convert_postgres_types(item) for item in obj]
-    return obj
-
-
-async def query_database(query: str) -> Dict[str, Any]:
+async def query_database(query: str, progress: Optional[ProgressReporter] = None) -> Dict[str, Any]:
     """Execute a SELECT query on the PostgreSQL database"""
     try:
         async with db_pool.acquire() as conn:
+            if progress is not None:
+                # Read incrementally; chunks also go out in the notifications as they arrive
+                result = []
+                max_rows = Config.PROGRESS_RESULT_MAX_ROWS
+                async with progress, conn.transaction(readonly=True):
+                    cursor = await conn.cursor(query)
+                    while True:
+                        rows = await cursor.fetch(Config.PROGRESS_CHUNK_SIZE)
+                        if not rows:
+                            break
+                        chunk = [convert_postgres_types(dict(row)) for row in rows]
+                        progress.rows += len(chunk)
+                        if max_rows <= 0:
+                            result.extend(chunk)
+                        elif len(result) < max_rows:
+                            result.extend(chunk[:max_rows - len(result)])
+                        await progress.report(chunk)
+                response = {
+                    "rows": result,
+                    "row_count": progress.rows
+                }
+                if len(result) < progress.rows:
+                    response["truncated"] = True
+                    response["note"] = (f"Only the first {len(result)} rows are included; "
+                                        f"use submit_query to read large results")
+                return {"result": response}
             rows = await conn.fetch(query)
             result = [convert_postgres_types(dict(row)) for row in rows]
             return {
@@ -151,12 +243,18 @@ async def get_table_indexes(table_name: str) -> Dict[str, Any]:
         return {"error": str(e)}
 
 
-async def analyze_query_plan(query: str) -> Dict[str, Any]:
+async def analyze_query_plan(query: str, progress: Optional[ProgressReporter] = None) -> Dict[str, Any]:
     """Analyze and return the execution plan for a SQL query using EXPLAIN"""
     try:
         explain_query = f"EXPLAIN (FORMAT JSON) {query}"
         async with db_pool.acquire() as conn:
-            result = await conn.fetchval(explain_query)
+            if progress is None:
+                result = await conn.fetchval(explain_query)
+            else:
+                # Planning yields a single value; the heartbeat reports elapsed time meanwhile
+                async with progress:
+                    result = await conn.fetchval(explain_query)
+                    await progress.report(message=f"Plan ready in {progress.elapsed()}s")
             return {
                 "result": {
                     "query": query,
@@ -168,6 +266,42 @@ async def analyze_query_plan(query: str) -> Dict[str, Any]:
         return {"error": str(e)}
 
 
+async def submit_query(query: str) -> Dict[str, Any]:
+    """Submit a SELECT query as a background job"""
+    try:
+        return {"result": await job_scheduler.submit(query)}
+    except Exception as e:
+        logger.error(f"Submit query error: {e}")
+        return {"error": str(e)}
+
+
+async def job_status(job_id: str) -> Dict[str, Any]:
+    """Get the status of a background query job"""
+    try:
+        return {"result": await job_scheduler.status(job_id)}
+    except Exception as e:
+        logger.error(f"Job status error: {e}")
+        return {"error": str(e)}
+
+
+async def fetch_job_result(job_id: str, offset: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Fetch a page of rows from a completed background query job"""
+    try:
+        return {"result": await job_scheduler.fetch_result(job_id, offset, limit)}
+    except Exception as e:
+        logger.error(f"Fetch job result error: {e}")
+        return {"error": str(e)}
+
+
+async def cancel_job(job_id: str) -> Dict[str, Any]:
+    """Cancel a queued or running background query job"""
+    try:
+        return {"result": await job_scheduler.cancel(job_id)}
+    except Exception as e:
+        logger.error(f"Cancel job error: {e}")
+        return {"error": str(e)}
+
+
 # MCP Protocol Implementation
 
 TOOLS = [
@@ -226,7 +360,7 @@ TOOLS = [
             "required": ["query"]
         }
     }
-]
+] + JOB_TOOLS
 
 
 async def handle_request(request: Dict[str, Any]) -> Dict[str, Any]:
@@ -256,18 +390,28 @@ async def handle_request(request: Dict[str, Any]) -> Dict[str, Any]:
     elif method == "tools/call":
         tool_name = params.get("name")
         arguments = params.get("arguments", {})
+        progress_token = (params.get("_meta") or {}).get("progressToken")
+        progress = ProgressReporter(progress_token) if progress_token is not None else None
 
         logger.info(f"Calling tool: {tool_name} with arguments: {arguments}")
 
         # Route to appropriate tool (read-only)
         if tool_name == "query_database":
-            result = await query_database(arguments.get("query"))
+            result = await query_database(arguments.get("query"), progress)
         elif tool_name == "list_tables":
             result = await list_tables(arguments.get("schema", "public"))
         elif tool_name == "get_table_indexes":
             result = await get_table_indexes(arguments.get("table_name"))
         elif tool_name == "analyze_query_plan":
-            result = await analyze_query_plan(arguments.get("query"))
+            result = await analyze_query_plan(arguments.get("query"), progress)
+        elif tool_name == "submit_query":
+            result = await submit_query(arguments.get("query"))
+        elif tool_name == "job_status":
+            result = await job_status(arguments.get("job_id"))
+        elif tool_name == "fetch_job_result":
+            result = await fetch_job_result(arguments.get("job_id"), arguments.get("offset", 0), arguments.get("limit"))
+        elif tool_name == "cancel_job":
+            result = await cancel_job(arguments.get("job_id"))
         else:
             result = {"error": f"Unknown tool: {tool_name}"}
 
@@ -324,7 +468,7 @@ async def main():
                     response["id"] = request["id"]
 
                 # Write JSON response to stdout
-                print(json.dumps(response, cls=PostgresJSONEncoder), flush=True)
+                await write_message(response)
                 logger.debug(f"Response: {response}")
 
             except json.JSONDecodeError as e:
@@ -335,7 +479,7 @@ async def main():
                         "message": "Parse error"
                     }
                 }
-                print(json.dumps(error_response), flush=True)
+                await write_message(error_response)
 
             except Exception as e:
                 logger.error(f"Error processing request: {e}", exc_info=True)
@@ -345,7 +489,7 @@ async def main():
                         "message": str(e)
                     }
                 }
-                print(json.dumps(error_response), flush=True)
+                await write_message(error_response)
 
     finally:
         await close_db()